@@ -1,28 +1,68 @@
+import asyncio
+import importlib
+import io
+import re
 import streamlit as st
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-import json
+from functools import cache, lru_cache
+import orjson
 from langchain_core.messages import HumanMessage
 
-from agents.fundamentals import fundamentals_agent
-from agents.portfolio_manager import portfolio_management_agent
-from agents.technicals import technical_analyst_agent
-from agents.risk_manager import risk_management_agent
-from agents.sentiment import sentiment_agent
 from graph.state import AgentState
-from agents.valuation import valuation_agent
-from utils.display import print_trading_output
 from langgraph.graph import END, StateGraph
 
 st.set_page_config(page_title="AI Hedge Fund Streamlit", layout="wide")
 
-def parse_hedge_fund_response(response):
+# Dictionary of all available analysts, mapping each to its node (and agent function) name and module
+_ANALYST_NODES = {
+    "technical_analyst": ("technical_analyst_agent", "agents.technicals"),
+    "fundamentals_analyst": ("fundamentals_agent", "agents.fundamentals"),
+    "sentiment_analyst": ("sentiment_agent", "agents.sentiment"),
+    "valuation_analyst": ("valuation_agent", "agents.valuation"),
+}
+_DEFAULT_ANALYSTS = ("technical_analyst", "fundamentals_analyst", "sentiment_analyst", "valuation_analyst")
+
+# Indentation prefixes for nested signal levels; deeper levels reuse the last entry
+_INDENTS = ["&nbsp;" * 4 * i for i in range(16)]
+
+_DETAIL_SPLIT = re.compile(r",\s+")
+
+# The opening message is the same for every run, so it is built once
+_HUMAN_MSG = HumanMessage(content="Make a trading decision based on the provided data.")
+
+@cache
+def _load_agent(module_name, func_name):
+    """Import an agent function on first use so only the selected analysts are loaded."""
+    return getattr(importlib.import_module(module_name), func_name)
+
+@lru_cache(maxsize=256)
+def _split_details(details):
+    """Split a comma-separated details string into its metrics, memoized across reruns."""
+    return tuple(_DETAIL_SPLIT.split(details))
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _parse_json(response):
+    """Parse a JSON response, returning None when it is invalid so failures are cached too."""
     try:
-        return json.loads(response)
-    except:
-        st.error(f"Error parsing response: {response}")
+        return orjson.loads(response)
+    except orjson.JSONDecodeError:
         return None
 
+def _normalize_confidence(value):
+    """Return a decision confidence as (fraction for st.progress, whole percent), accepting 0-1 or 0-100 values."""
+    confidence = float(value)
+    if confidence > 1:
+        confidence /= 100
+    confidence = min(max(confidence, 0.0), 1.0)
+    return confidence, round(confidence * 100)
+
+def parse_hedge_fund_response(response):
+    decision = _parse_json(response)
+    if decision is None:
+        st.error(f"Error parsing response: {response}")
+    return decision
+
 def create_workflow(selected_analysts=None):
     """Create the workflow with selected analysts."""
     workflow = StateGraph(AgentState)
@@ -30,29 +70,22 @@ def create_workflow(selected_analysts=None):
     
     # Default to all analysts if none selected
     if selected_analysts is None:
-        selected_analysts = ["technical_analyst", "fundamentals_analyst", "sentiment_analyst", "valuation_analyst"]
-    
-    # Dictionary of all available analysts
-    analyst_nodes = {
-        "technical_analyst": ("technical_analyst_agent", technical_analyst_agent),
-        "fundamentals_analyst": ("fundamentals_agent", fundamentals_agent),
-        "sentiment_analyst": ("sentiment_agent", sentiment_agent),
-        "valuation_analyst": ("valuation_agent", valuation_agent),
-    }
+        selected_analysts = _DEFAULT_ANALYSTS
     
     # Add selected analyst nodes
+    analyst_node_names = []
     for analyst_key in selected_analysts:
-        node_name, node_func = analyst_nodes[analyst_key]
-        workflow.add_node(node_name, node_func)
+        node_name, module_name = _ANALYST_NODES[analyst_key]
+        workflow.add_node(node_name, _load_agent(module_name, node_name))
         workflow.add_edge("start_node", node_name)
+        analyst_node_names.append(node_name)
     
     # Always add risk and portfolio management
-    workflow.add_node("risk_management_agent", risk_management_agent)
-    workflow.add_node("portfolio_management_agent", portfolio_management_agent)
+    workflow.add_node("risk_management_agent", _load_agent("agents.risk_manager", "risk_management_agent"))
+    workflow.add_node("portfolio_management_agent", _load_agent("agents.portfolio_manager", "portfolio_management_agent"))
     
     # Connect selected analysts to risk management
-    for analyst_key in selected_analysts:
-        node_name = analyst_nodes[analyst_key][0]
+    for node_name in analyst_node_names:
         workflow.add_edge(node_name, "risk_management_agent")
     
     workflow.add_edge("risk_management_agent", "portfolio_management_agent")
@@ -61,25 +94,29 @@ def create_workflow(selected_analysts=None):
     workflow.set_entry_point("start_node")
     return workflow
 
-def run_hedge_fund(
+@st.cache_resource(max_entries=16, show_spinner=False)
+def get_compiled_agent(analyst_key: tuple):
+    """Compile the workflow once per distinct analyst selection and reuse it across runs."""
+    workflow = create_workflow(analyst_key)
+    return workflow.compile()
+
+async def run_hedge_fund(
     ticker: str,
     start_date: str,
     end_date: str,
     portfolio: dict,
     show_reasoning: bool = False,
     selected_analysts: list = None,
+    on_signal=None,
 ):
-    # Create a new workflow if analysts are customized
-    workflow = create_workflow(selected_analysts)
-    agent = workflow.compile()
+    # Reuse the compiled workflow for this analyst selection
+    agent = get_compiled_agent(tuple(sorted(selected_analysts or _DEFAULT_ANALYSTS)))
 
-    final_state = agent.invoke(
+    analyst_signals = {}
+    decision_message = None
+    async for update in agent.astream(
         {
-            "messages": [
-                HumanMessage(
-                    content="Make a trading decision based on the provided data.",
-                )
-            ],
+            "messages": [_HUMAN_MSG],
             "data": {
                 "ticker": ticker,
                 "portfolio": portfolio,
@@ -91,66 +128,190 @@ def run_hedge_fund(
                 "show_reasoning": show_reasoning,
             },
         },
-    )
+        stream_mode="updates",
+    ):
+        # Each update maps the node that just finished to the state it returned
+        for node_name, node_state in update.items():
+            signals = node_state["data"]["analyst_signals"]
+            if node_name in signals and node_name not in analyst_signals:
+                analyst_signals[node_name] = signals[node_name]
+                if on_signal is not None:
+                    on_signal(node_name, signals[node_name])
+            if node_name == "portfolio_management_agent":
+                decision_message = node_state["messages"][-1]
+
     return {
-        "decision": parse_hedge_fund_response(final_state["messages"][-1].content),
-        "analyst_signals": final_state["data"]["analyst_signals"],
+        "decision": parse_hedge_fund_response(decision_message.content),
+        "analyst_signals": analyst_signals,
     }
 
 def display_signal(signal_data, level=0):
-    """Recursively display nested signal data in a user-friendly format."""
-    if isinstance(signal_data, dict):
-        for key, value in signal_data.items():
-            # Format key to be more readable
-            display_key = key.replace('_', ' ').title()
-            indent = "&nbsp;&nbsp;&nbsp;&nbsp;" * level
-            
-            # Handle signal types
-            if key == 'signal':
-                signal_color = {
-                    "bullish": "🟢 Bullish",
-                    "bearish": "🔴 Bearish",
-                    "neutral": "🟡 Neutral",
-                    "hold": "🟡 Hold",
-                }.get(str(value).lower(), str(value))
-                st.markdown(f"{indent}• **Signal:** {signal_color}", unsafe_allow_html=True)
-            
-            # Handle confidence values
-            elif key == 'confidence':
-                st.markdown(f"{indent}• **Confidence:** {value}%", unsafe_allow_html=True)
-                st.progress(float(value) / 100)
-            
-            # Handle nested reasoning
-            elif key == 'reasoning':
-                st.divider()
-                # st.markdown(f"{indent} *<span style='color: grey'>**Reasoning:**</span>*", unsafe_allow_html=True)
-                if isinstance(value, dict):
-                    for sub_key, sub_value in value.items():
-                        st.markdown(f"{indent}**{sub_key.replace('_', ' ').title()}**")
-                        display_signal(sub_value, level + 1)
-                else:
-                    st.markdown(f"{indent}&nbsp;&nbsp;{value}", unsafe_allow_html=True)
-            
-            # Handle details directly
-            elif key == 'details':
-                metrics = value.split(', ')
-                cols = st.columns(min(3, len(metrics)))
-                for idx, metric in enumerate(metrics):
-                    with cols[idx % 3]:
-                        st.markdown(f"{indent}• {metric}", unsafe_allow_html=True)
-            
-            # Handle other nested dictionaries
-            elif isinstance(value, dict):
-                # st.markdown(f"{indent}• <span style='color: grey'>{display_key}:</span>", unsafe_allow_html=True)
-                st.markdown(f"{indent} *<span style='color: grey'>**{display_key}:**</span>*", unsafe_allow_html=True)
-                display_signal(value, level + 1)
-            
-            # Handle other simple values
+    """Display nested signal data in a user-friendly format, batching text into as few markdown calls as possible."""
+    buffer = io.StringIO()
+
+    def write(line):
+        # Each line is its own markdown paragraph
+        buffer.write(line)
+        buffer.write("\n\n")
+
+    def flush():
+        # Emit the buffered text as a single markdown element
+        if buffer.tell():
+            st.markdown(buffer.getvalue(), unsafe_allow_html=True)
+            buffer.seek(0)
+            buffer.truncate()
+
+    # Walk the signal depth-first; entries are either pre-rendered lines or (level, key, value) items,
+    # where a key of None marks a bare value to expand
+    stack = [(level, None, signal_data)]
+    while stack:
+        entry = stack.pop()
+        if isinstance(entry, str):
+            write(entry)
+            continue
+
+        level, key, value = entry
+        indent = _INDENTS[min(level, len(_INDENTS) - 1)]
+
+        if key is None:
+            if isinstance(value, dict):
+                stack.extend((level, sub_key, sub_value) for sub_key, sub_value in reversed(value.items()))
+            else:
+                write(f"{indent}• {value}")
+            continue
+
+        # Format key to be more readable
+        display_key = key.replace('_', ' ').title()
+
+        # Handle signal types
+        if key == 'signal':
+            signal_color = {
+                "bullish": "🟢 Bullish",
+                "bearish": "🔴 Bearish",
+                "neutral": "🟡 Neutral",
+                "hold": "🟡 Hold",
+            }.get(str(value).lower(), str(value))
+            write(f"{indent}• **Signal:** {signal_color}")
+
+        # Handle confidence values
+        elif key == 'confidence':
+            write(f"{indent}• **Confidence:** {value}%")
+            flush()
+            st.progress(min(max(float(value) / 100, 0.0), 1.0))
+
+        # Handle nested reasoning
+        elif key == 'reasoning':
+            write("---")
+            if isinstance(value, dict):
+                for sub_key, sub_value in reversed(value.items()):
+                    stack.append((level + 1, None, sub_value))
+                    stack.append(f"{indent}**{sub_key.replace('_', ' ').title()}**")
             else:
-                # st.markdown(f"{indent}• **{display_key}:** {value}", unsafe_allow_html=True)
-                st.markdown(f"{indent} *<span style='color: grey'>**{display_key}:**</span>*", unsafe_allow_html=True)
-    else:
-        st.markdown(f"{indent}• {signal_data}", unsafe_allow_html=True)
+                write(f"{indent}&nbsp;&nbsp;{value}")
+
+        # Handle details directly; a single metric stays in the text buffer instead of a column layout
+        elif key == 'details':
+            metrics = _split_details(value)
+            if len(metrics) == 1:
+                write(f"{indent}• {metrics[0]}")
+                continue
+            flush()
+            num_cols = min(3, len(metrics))
+            for idx, col in enumerate(st.columns(num_cols)):
+                col.markdown("\n\n".join(f"{indent}• {metric}" for metric in metrics[idx::num_cols]), unsafe_allow_html=True)
+
+        # Handle other nested dictionaries
+        elif isinstance(value, dict):
+            write(f"{indent} *<span style='color: grey'>**{display_key}:**</span>*")
+            stack.append((level + 1, None, value))
+
+        # Handle other simple values
+        else:
+            write(f"{indent} *<span style='color: grey'>**{display_key}:**</span>*")
+
+    flush()
+
+def display_decision(decision):
+    """Display the portfolio manager's trading decision."""
+    st.subheader("Trading Decision", divider="rainbow")
+    
+    # Action with color coding
+    action_color = {
+        "buy": "green",
+        "sell": "red",
+        "hold": "orange"
+    }.get(decision["action"].lower(), "blue")
+    confidence, confidence_pct = _normalize_confidence(decision['confidence'])
+    
+    with st.container():
+        # Key metrics as a single markdown table, with the confidence bar underneath
+        st.markdown(
+            "| Action | Quantity | Confidence |\n"
+            "| --- | --- | --- |\n"
+            f"| :{action_color}[{decision['action'].upper()}] | {decision['quantity']} | {confidence_pct}% |"
+        )
+        st.progress(confidence)
+        
+        # Reasoning in a box
+        st.markdown("**Reasoning:**")
+        st.info(decision["reasoning"])
+
+@st.fragment
+def results_panel(ticker, start_date, end_date, portfolio, show_reasoning, selected_analysts):
+    """Run the analysis on demand and display the latest results.
+
+    Clicking the button only reruns this fragment, and the last result is kept in
+    st.session_state so other reruns redisplay it without invoking the agents again.
+    """
+    run_clicked = st.button("Run Analysis", type="primary")
+    if run_clicked:
+        st.session_state.pop("last_result", None)
+    elif "last_result" not in st.session_state:
+        return
+    
+    # Display results
+    st.header("Analysis Results")
+    decision_panel = st.container()
+    signals_panel = st.container()
+    shown_signals = []
+    
+    # Render each analyst's signal as soon as it is available
+    def show_signal(analyst, signal):
+        with signals_panel:
+            if not shown_signals:
+                st.subheader("Analyst Signals", divider="gray")
+            with st.expander(f"## {analyst.replace('_', ' ').title()}"):
+                display_signal(signal)
+        shown_signals.append(analyst)
+    
+    try:
+        if run_clicked:
+            with st.spinner("Running hedge fund analysis..."):
+                result = asyncio.run(run_hedge_fund(
+                    ticker=ticker,
+                    start_date=start_date,
+                    end_date=end_date,
+                    portfolio=portfolio,
+                    show_reasoning=show_reasoning,
+                    selected_analysts=selected_analysts,
+                    on_signal=show_signal if show_reasoning else None,
+                ))
+            st.session_state["last_result"] = {"ticker": ticker, "start_date": start_date, "end_date": end_date, **result}
+        else:
+            result = st.session_state["last_result"]
+            if show_reasoning:
+                for analyst, signal in result["analyst_signals"].items():
+                    show_signal(analyst, signal)
+        
+        with decision_panel:
+            st.caption(f"{result['ticker']} from {result['start_date']} to {result['end_date']}")
+            if result["decision"]:
+                display_decision(result["decision"])
+            else:
+                st.error("No valid trading decision was generated.")
+    
+    except Exception as e:
+        st.error(f"An error occurred: {str(e)}")
 
 def main():
     st.title("AI Hedge Fund Trading System")
@@ -200,71 +361,20 @@ def main():
         st.warning("You must select at least one analyst.")
         return
     
-    # Run button
-    if st.button("Run Analysis", type="primary"):
-        with st.spinner("Running hedge fund analysis..."):
-            try:
-                portfolio = {
-                    "cash": initial_cash,
-                    "stock": initial_stock
-                }
-                
-                result = run_hedge_fund(
-                    ticker=ticker,
-                    start_date=start_date.strftime("%Y-%m-%d"),
-                    end_date=end_date.strftime("%Y-%m-%d"),
-                    portfolio=portfolio,
-                    show_reasoning=show_reasoning,
-                    selected_analysts=selected_analysts
-                )
-                
-                # Display results
-                st.header("Analysis Results")
-                
-                if result["decision"]:
-                    decision = result["decision"]
-                    st.subheader("Trading Decision", divider="rainbow")
-                    
-                    # Create columns for key metrics
-                    col1, col2, col3 = st.columns(3)
-                    
-                    # Action with color coding
-                    with col1:
-                        action_color = {
-                            "buy": "green",
-                            "sell": "red",
-                            "hold": "orange"
-                        }.get(decision["action"].lower(), "blue")
-                        
-                        st.markdown(f"**Action:**")
-                        st.markdown(f":{action_color}[{decision['action'].upper()}]")
-                    
-                    # Quantity
-                    with col2:
-                        st.markdown("**Quantity:**")
-                        st.markdown(f"{decision['quantity']}")
-                    
-                    # Confidence with progress bar
-                    with col3:
-                        st.markdown("**Confidence:**")
-                        st.progress(float(decision['confidence']))
-                        st.markdown(f"{int(float(decision['confidence']) * 100)}%")
-                    
-                    # Reasoning in a box
-                    st.markdown("**Reasoning:**")
-                    st.info(decision["reasoning"])
-
-                    # Display analyst signals if show_reasoning is True
-                    if show_reasoning and result["analyst_signals"]:
-                        st.subheader("Analyst Signals", divider="gray")
-                        for analyst, signal in result["analyst_signals"].items():
-                            with st.expander(f"## {analyst.replace('_', ' ').title()}"):
-                                display_signal(signal)
-                else:
-                    st.error("No valid trading decision was generated.")
-                    
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
+    portfolio = {
+        "cash": initial_cash,
+        "stock": initial_stock
+    }
+    
+    # Run button and results
+    results_panel(
+        ticker=ticker,
+        start_date=start_date.isoformat(),
+        end_date=end_date.isoformat(),
+        portfolio=portfolio,
+        show_reasoning=show_reasoning,
+        selected_analysts=selected_analysts,
+    )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file